@@ -4,22 +4,303 @@ The code is cloned from https://github.com/mganjoo/apple-health-exporter.
 
 import argparse
 import os
+import re
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import tempfile
+import warnings
 import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
 from pathlib import Path
 from lxml import etree
 
+from .stats import Stats
+
 DATETIME_KEYS = ["startDate", "endDate"]
 NUMERIC_KEYS = ["value"]
 OTHER_KEYS = ["type", "sourceName", "unit"]
 ALL_KEYS = OTHER_KEYS + DATETIME_KEYS + NUMERIC_KEYS
 
+WORKOUT_NUMERIC_KEYS = ["duration", "totalDistance", "totalEnergyBurned"]
+WORKOUT_OTHER_KEYS = [
+    "workoutActivityType",
+    "sourceName",
+    "durationUnit",
+    "totalDistanceUnit",
+    "totalEnergyBurnedUnit",
+]
+WORKOUT_KEYS = WORKOUT_OTHER_KEYS + DATETIME_KEYS + WORKOUT_NUMERIC_KEYS
+
+ACTIVITY_NUMERIC_KEYS = [
+    "activeEnergyBurned",
+    "activeEnergyBurnedGoal",
+    "appleMoveTime",
+    "appleMoveTimeGoal",
+    "appleExerciseTime",
+    "appleExerciseTimeGoal",
+    "appleStandHours",
+    "appleStandHoursGoal",
+]
+ACTIVITY_KEYS = ["dateComponents", "activeEnergyBurnedUnit"] + ACTIVITY_NUMERIC_KEYS
+
+ROUTE_SCHEMA = pa.schema(
+    [
+        ("route", pa.int32()),
+        ("time", pa.timestamp("ns", tz="UTC")),
+        ("lat", pa.float32()),
+        ("lon", pa.float32()),
+        ("elevation", pa.float32()),
+        ("speed", pa.float32()),
+    ]
+)
+ECG_SCHEMA = pa.schema(
+    [
+        ("ecg", pa.int32()),
+        ("time", pa.timestamp("ns", tz="UTC")),
+        ("voltage", pa.float32()),
+    ]
+)
+
+
+def _to_float(text):
+    return float(text) if text else np.nan
+
+
+def parse_route(gpx_path):
+    """Read the track points of one workout route into compact arrays."""
+    times, lat, lon, ele, speed = [], [], [], [], []
+    for _, point in etree.iterparse(str(gpx_path), tag="{*}trkpt"):
+        times.append(point.findtext("{*}time"))
+        lat.append(_to_float(point.get("lat")))
+        lon.append(_to_float(point.get("lon")))
+        ele.append(_to_float(point.findtext("{*}ele")))
+        speed.append(_to_float(point.findtext("{*}extensions/{*}speed")))
+        point.clear()
+
+    time = pd.to_datetime(times, utc=True).as_unit("ns")
+    return {
+        "time": time.asi8.view("datetime64[ns]"),
+        "lat": np.array(lat, dtype=np.float32),
+        "lon": np.array(lon, dtype=np.float32),
+        "elevation": np.array(ele, dtype=np.float32),
+        "speed": np.array(speed, dtype=np.float32),
+    }
+
+
+def _ecg_timestamp(text):
+    timestamp = pd.Timestamp(text.strip().strip('"'))
+    if timestamp is pd.NaT:
+        raise ValueError(f"not a timestamp: {text!r}")
+    return timestamp
+
+
+def _ecg_sample_rate(text):
+    text = text.strip().strip('"')
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*(?:hertz|hz)", text, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"not a sample rate: {text!r}")
+    return float(match[1])
+
+
+def parse_ecg(csv_path):
+    """Read the voltage samples of one electrocardiogram into compact arrays."""
+    with open(csv_path, encoding="utf-8-sig") as f:
+        blocks = re.split(r"\n\s*\n", f.read().strip())
+
+    # Metadata ("Key,Value" lines) is split into blocks by blank lines, and
+    # the samples follow the last blank line, one value per line.
+    pairs = [
+        line.split(",", 1)
+        for block in blocks[:-1]
+        for line in block.splitlines()
+        if "," in line
+    ]
+    meta = dict(pairs)
+
+    def lookup(key, position, parse):
+        # Header keys are localized, so fall back to the line position, but
+        # only trust it if the value there parses
+        if key in meta:
+            value = meta[key]
+        elif len(pairs) > position:
+            value = pairs[position][1]
+        else:
+            value = None
+        try:
+            return parse(value)
+        except (TypeError, ValueError):
+            raise ValueError(
+                f"{Path(csv_path).name}: {key} not found in ECG header"
+            ) from None
+
+    recorded = lookup("Recorded Date", 2, _ecg_timestamp)
+    rate = lookup("Sample Rate", 7, _ecg_sample_rate)
+
+    voltage = np.array(blocks[-1].split(), dtype=np.float32)
+    offsets = np.arange(len(voltage)) * (1e9 / rate)
+    return {
+        "time": (recorded.value + offsets.astype(np.int64)).view("datetime64[ns]"),
+        "voltage": voltage,
+    }
+
+
+def _parse_member(parse, path):
+    # Report failures as text, since not every parser exception pickles
+    try:
+        return parse(path)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def _write_batches(paths, parse, id_column, schema, output_file, executor, jobs):
+    # Keep at most 2 * jobs members in flight and write one record batch per
+    # member, so the parsed points of thousands of workouts never have to sit
+    # in memory at the same time. Member ids are positions in ``paths``.
+    members = enumerate(paths)
+    pending = deque()
+
+    def submit(n):
+        for i, path in islice(members, n):
+            pending.append((i, path, executor.submit(_parse_member, parse, path)))
+
+    rows = 0
+    submit(2 * jobs)
+    with pa.OSFile(str(output_file), "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            while pending:
+                i, path, future = pending.popleft()
+                columns = future.result()
+                submit(1)
+                if isinstance(columns, str):
+                    warnings.warn(f"Skipping {path.name}: {columns}")
+                    continue
+
+                n = len(columns["time"])
+                columns[id_column] = np.full(n, i, dtype=np.int32)
+                arrays = [pa.array(columns[f.name], type=f.type) for f in schema]
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+                rows += n
+    return rows
+
+
+def _route_id(workout, route_ids):
+    paths = workout.xpath("WorkoutRoute/FileReference/@path")
+    return route_ids.get(Path(paths[0]).name, -1) if paths else -1
+
+
+def _workout_row(workout):
+    row = {key: workout.get(key) for key in WORKOUT_KEYS}
+    # iOS 16+ moved the totals into <WorkoutStatistics> children
+    for stat in workout.iterfind("WorkoutStatistics"):
+        type_ = stat.get("type", "")
+        if type_.startswith("HKQuantityTypeIdentifierDistance"):
+            key = "totalDistance"
+        elif type_ == "HKQuantityTypeIdentifierActiveEnergyBurned":
+            key = "totalEnergyBurned"
+        else:
+            continue
+        if row[key] is None and stat.get("sum") is not None:
+            row[key] = stat.get("sum")
+            row[f"{key}Unit"] = stat.get("unit")
+    return row
+
+
+def _rows_to_df(rows, keys, datetime_keys, numeric_keys):
+    df = pd.DataFrame(rows)
+    df = df.reindex(columns=keys)
+    for k in datetime_keys:
+        df[k] = pd.to_datetime(df[k])
+    for k in numeric_keys:
+        df[k] = pd.to_numeric(df[k]).astype(np.float32)
+    return df
+
+
+def extras_to_feather(tree, export_dir, output_file, jobs=None):
+    """
+    Write workouts, activity summaries, workout routes and electrocardiograms
+    next to ``output_file`` as ``<stem>_workouts.feather``,
+    ``<stem>_activity.feather``, ``<stem>_routes.feather`` and
+    ``<stem>_ecg.feather``. Route and ECG members are parsed in parallel;
+    members that fail to parse are skipped with a warning.
+    Returns the total number of rows written.
+    """
+    output_file = Path(output_file)
+
+    def sibling(name):
+        return output_file.with_name(f"{output_file.stem}_{name}.feather")
+
+    route_paths = sorted((export_dir / "workout-routes").glob("*.gpx"))
+    ecg_paths = sorted((export_dir / "electrocardiograms").glob("*.csv"))
+    route_ids = {p.name: i for i, p in enumerate(route_paths)}
+
+    workouts = tree.xpath("//Workout")
+    workout_df = _rows_to_df(
+        [_workout_row(w) for w in workouts],
+        WORKOUT_KEYS,
+        DATETIME_KEYS,
+        WORKOUT_NUMERIC_KEYS,
+    )
+    # Link each workout to its row block in the routes table, -1 if none
+    workout_df["route"] = np.array(
+        [_route_id(w, route_ids) for w in workouts], dtype=np.int32
+    )
+    workout_df.to_feather(sibling("workouts"))
+
+    summaries = tree.xpath("//ActivitySummary")
+    activity_df = _rows_to_df(
+        [{key: a.get(key) for key in ACTIVITY_KEYS} for a in summaries],
+        ACTIVITY_KEYS,
+        [],
+        ACTIVITY_NUMERIC_KEYS,
+    )
+    activity_df["dateComponents"] = pd.to_datetime(activity_df["dateComponents"])
+    activity_df.to_feather(sibling("activity"))
+
+    # Don't start workers when there is nothing to parse; the empty tables
+    # are still written
+    jobs = jobs or os.cpu_count() or 1
+    if route_paths or ecg_paths:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+    else:
+        pool = nullcontext()
+    with pool as executor:
+        route_rows = _write_batches(
+            route_paths,
+            parse_route,
+            "route",
+            ROUTE_SCHEMA,
+            sibling("routes"),
+            executor,
+            jobs,
+        )
+        ecg_rows = _write_batches(
+            ecg_paths, parse_ecg, "ecg", ECG_SCHEMA, sibling("ecg"), executor, jobs
+        )
+
+    return len(workout_df) + len(activity_df) + route_rows + ecg_rows
+
+
+def health_xml_to_feather(
+    zip_file,
+    output_file,
+    remove_zip=False,
+    xml_file_name=None,
+    extras=False,
+    jobs=None,
+    stats=None,
+):
+    if stats is None:
+        stats = Stats(enabled=False)
 
-def health_xml_to_feather(zip_file, output_file, remove_zip=False, xml_file_name=None):
     with tempfile.TemporaryDirectory() as tmpdirname:
-        f = zipfile.ZipFile(zip_file, "r")
-        f.extractall(tmpdirname)
+        with stats.stage("unzip") as s:
+            f = zipfile.ZipFile(zip_file, "r")
+            f.extractall(tmpdirname)
+            s["rows"] = len(f.infolist())
         if xml_file_name is None:
             # Use stem to get export.xml file name in localized
             # versions of Apple Health
@@ -32,15 +313,28 @@ def health_xml_to_feather(zip_file, output_file, remove_zip=False, xml_file_name
                 "XML file not found and could not be inferred from zip "
                 + "name. Please specify file name with --xml_file_name option."
             )
-        tree = etree.parse(str(xml_path))
-        records = tree.xpath("//Record")
-        df = pd.DataFrame([{key: r.get(key) for key in ALL_KEYS} for r in records])
+        with stats.stage("parse") as s:
+            tree = etree.parse(str(xml_path))
+            records = tree.xpath("//Record")
+            s["rows"] = len(records)
+
+        with stats.stage("convert") as s:
+            df = pd.DataFrame([{key: r.get(key) for key in ALL_KEYS} for r in records])
 
-        # Clean up key types
-        for k in DATETIME_KEYS:
-            df[k] = pd.to_datetime(df[k])
+            # Clean up key types
+            for k in DATETIME_KEYS:
+                df[k] = pd.to_datetime(df[k])
+            s["rows"] = len(df)
 
-        df.to_feather(output_file)
+        with stats.stage("write") as s:
+            df.to_feather(output_file)
+            s["rows"] = len(df)
+        # Free the records before extras, which fork worker processes
+        del df, records
+
+        if extras:
+            with stats.stage("extras", children=True) as s:
+                s["rows"] = extras_to_feather(tree, xml_path.parent, output_file, jobs)
 
     if remove_zip:
         os.remove(zip_file)
@@ -63,7 +357,35 @@ def main():
         help="name of xml file within export.zip - by "
         + " default, inferred from zip file name stem",
     )
+    parser.add_argument(
+        "--extras",
+        dest="extras",
+        action="store_true",
+        help="also export workouts, activity summaries, workout routes and "
+        + "electrocardiograms to <output>_*.feather files (default: false)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="number of processes used to parse routes and electrocardiograms "
+        + "- by default, the number of CPUs",
+    )
+    parser.add_argument(
+        "--stats",
+        dest="stats",
+        action="store_true",
+        help="print per-stage timing, row and memory stats as JSON (default: false)",
+    )
     args = parser.parse_args()
+    stats = Stats(enabled=args.stats)
     health_xml_to_feather(
-        args.input_file, args.output_file, args.remove_zip, args.xml_file_name
+        args.input_file,
+        args.output_file,
+        args.remove_zip,
+        args.xml_file_name,
+        args.extras,
+        args.jobs,
+        stats,
     )
+    if args.stats:
+        print(stats.to_json())
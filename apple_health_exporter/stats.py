@@ -0,0 +1,121 @@
+"""
+Lightweight timing and memory instrumentation shared by the exporter and pages.
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+_MAXRSS_TO_MB = 1 / 2**20 if sys.platform == "darwin" else 1 / 2**10
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS (VmHWM); False where that isn't supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(children=False):
+    peak = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 2**10
+                    break
+    except OSError:
+        pass
+    if resource is None:
+        return peak
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_TO_MB
+    if children:
+        child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        peak = max(peak, child * _MAXRSS_TO_MB)
+    return peak
+
+
+class Stats:
+    """
+    Collect wall time, rows processed, rows/sec and peak RSS per stage.
+
+    On Linux the kernel's peak RSS is reset when a stage starts, so
+    ``peak_rss_mb`` is the highest resident memory reached during the stage
+    (``meta["peak_rss_scope"] == "stage"``). Elsewhere it falls back to
+    ``ru_maxrss``, the peak since the process started (``"process"``). RSS
+    counts every allocation, including libxml2 and Arrow, but is
+    process-wide, so in a Streamlit server it also includes other sessions.
+    Stages that run worker processes pass ``children=True`` to include the
+    largest worker. Repeated stage names are merged. With ``enabled=False``
+    stages are not recorded at all.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._stages = {}
+        self.meta = {}
+
+    @property
+    def stages(self):
+        return list(self._stages.values())
+
+    def __contains__(self, name):
+        return name in self._stages
+
+    @contextmanager
+    def stage(self, name, children=False):
+        """Time the enclosed block; set ``rows`` on the yielded record."""
+        record = {"stage": name, "rows": None}
+        if not self.enabled:
+            yield record
+            return
+
+        scope = "stage" if _reset_peak_rss() else "process"
+        self.meta["peak_rss_scope"] = scope
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            self._add(name, seconds, record["rows"], _peak_rss_mb(children))
+
+    def _add(self, name, seconds, rows, peak):
+        total = self._stages.setdefault(
+            name,
+            {
+                "stage": name,
+                "rows": None,
+                "seconds": 0.0,
+                "rows_per_sec": None,
+                "peak_rss_mb": None,
+            },
+        )
+        total["seconds"] += seconds
+        if rows is not None:
+            total["rows"] = (total["rows"] or 0) + rows
+        if peak is not None:
+            total["peak_rss_mb"] = round(max(total["peak_rss_mb"] or 0, peak), 3)
+        rows, seconds = total["rows"], total["seconds"]
+        total["rows_per_sec"] = round(rows / seconds, 1) if rows and seconds else None
+
+    def to_dict(self):
+        stages = [{**s, "seconds": round(s["seconds"], 6)} for s in self.stages]
+        return {
+            **self.meta,
+            "total_seconds": round(sum(s["seconds"] for s in self.stages), 6),
+            "stages": stages,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
@@ -0,0 +1,35 @@
+import pandas as pd
+import streamlit as st
+from apple_health_exporter.stats import Stats
+
+
+def debug_stats():
+    """Add the sidebar debug toggle and return a Stats for this page run."""
+    # Re-assign so the toggle keeps its state when switching pages
+    st.session_state.show_stats = st.session_state.get("show_stats", False)
+    st.sidebar.toggle(
+        "Debug stats",
+        key="show_stats",
+        help="Show per-stage timing, rows and peak memory of this page",
+    )
+    return Stats(enabled=st.session_state.show_stats)
+
+
+def debug_panel(stats):
+    if not stats.enabled:
+        return
+
+    st.divider()
+    with st.expander("Debug stats", expanded=True):
+        if "cache_hit" in stats.meta:
+            st.write(f"`get_df` cache hit: **{stats.meta['cache_hit']}**")
+        summary = stats.to_dict()
+        st.dataframe(
+            pd.DataFrame(summary["stages"]), hide_index=True, use_container_width=True
+        )
+        scope = summary.get("peak_rss_scope")
+        note = " since server start" if scope == "process" else " during each stage"
+        st.caption(
+            f"Total: {summary['total_seconds']:.3f} s. "
+            f"Peak RSS is for the whole server process{note}."
+        )
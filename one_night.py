@@ -3,46 +3,56 @@ import pandas as pd
 import streamlit as st
 from datetime import timedelta
 import os
+from debug import debug_panel, debug_stats
 
 @st.cache_data
-def get_df():
-    if st.session_state.using_fake:
-        df = st.session_state.df
-    else:
-        path = st.session_state.data_path
-        filename, file_extension = os.path.splitext(path)
-        if file_extension == ".feather":
-            df = pd.read_feather(path)
-        elif file_extension == ".csv":
-            df = pd.read_csv(
-                path, parse_dates=["startDate", "endDate"], date_format="%Y-%m-%d %H:%M:%S"
-            )
+def get_df(_stats):
+    # _stats is not hashed, and its stages are only recorded on a cache miss
+    with _stats.stage("load") as s:
+        if st.session_state.using_fake:
+            df = st.session_state.df
         else:
-            raise IOError(
-                "Unsupported file types. Currently supports .csv or .feather file."
-            )
-
-    df.drop_duplicates(inplace=True)
-
-    df = df.loc[
-        (df["type"] == "HKCategoryTypeIdentifierSleepAnalysis")
-        | (df["type"] == "HKQuantityTypeIdentifierHeartRate")
-    ]
-
-    date_col = ["startDate", "endDate"]
-    # apple health export useless time timezone offset (+/- hours:minutes) in export.xml
-    df[date_col] = df[date_col].apply(
-        lambda x: pd.to_datetime(
-            x.dt.strftime(date_format="%Y-%m-%d %H:%M:%S"), format="%Y-%m-%d %H:%M:%S"
-        ),
-        axis=1,
-    )
+            path = st.session_state.data_path
+            filename, file_extension = os.path.splitext(path)
+            if file_extension == ".feather":
+                df = pd.read_feather(path)
+            elif file_extension == ".csv":
+                df = pd.read_csv(
+                    path,
+                    parse_dates=["startDate", "endDate"],
+                    date_format="%Y-%m-%d %H:%M:%S",
+                )
+            else:
+                raise IOError(
+                    "Unsupported file types. Currently supports .csv or .feather file."
+                )
+        s["rows"] = len(df)
+
+    with _stats.stage("clean") as s:
+        df.drop_duplicates(inplace=True)
+
+        df = df.loc[
+            (df["type"] == "HKCategoryTypeIdentifierSleepAnalysis")
+            | (df["type"] == "HKQuantityTypeIdentifierHeartRate")
+        ]
+
+        date_col = ["startDate", "endDate"]
+        # apple health export useless time timezone offset (+/- hours:minutes)
+        # in export.xml
+        df[date_col] = df[date_col].apply(
+            lambda x: pd.to_datetime(
+                x.dt.strftime(date_format="%Y-%m-%d %H:%M:%S"),
+                format="%Y-%m-%d %H:%M:%S",
+            ),
+            axis=1,
+        )
 
-    # add time index
-    # D0 sleep: D0 18:00 - D1 18:00
-    df["idx"] = df["startDate"].apply(
-        lambda x: x.date() if x.hour >= 18 else x.date() - timedelta(days=1)
-    )
+        # add time index
+        # D0 sleep: D0 18:00 - D1 18:00
+        df["idx"] = df["startDate"].apply(
+            lambda x: x.date() if x.hour >= 18 else x.date() - timedelta(days=1)
+        )
+        s["rows"] = len(df)
 
     return df
 
@@ -55,6 +65,8 @@ st.set_page_config(
 st.markdown("# One Night Sleep")
 st.write("""Choose one date to investigate your sleep.""")
 
+stats = debug_stats()
+
 if "data_path" not in st.session_state:
     st.session_state.data_path = None
 if "df" not in st.session_state:
@@ -67,7 +79,8 @@ if st.session_state.data_path is None and st.session_state.df is None:
     if st.button("Home", type="primary"):
         st.switch_page("home.py")
 else:
-    df = get_df()
+    df = get_df(stats)
+    stats.meta["cache_hit"] = "load" not in stats
     date_ = st.date_input(
         "Date",
         value=df["idx"].max(),
@@ -75,50 +88,59 @@ else:
         max_value=df["idx"].max(),
     )
 
-    df = df[df["idx"] == date_]
-
-    # sleep stages
-    stage_df = df[df["type"] == "HKCategoryTypeIdentifierSleepAnalysis"]
-    type_map = {
-        "HKCategoryValueSleepAnalysisInBed": "In Bed",
-        "HKCategoryValueSleepAnalysisAsleepCore": "Core",
-        "HKCategoryValueSleepAnalysisAsleepREM": "REM",
-        "HKCategoryValueSleepAnalysisAsleepDeep": "Deep",
-        "HKCategoryValueSleepAnalysisAwake": "Awake",
-    }
-
-    stage_df = stage_df[["value", "startDate", "endDate"]]
-    stage_df.rename(
-        columns={"value": "type", "startDate": "start", "endDate": "end"}, inplace=True
-    )
-    stage_df["type"] = stage_df["type"].map(type_map)
+    with stats.stage("filter") as s:
+        df = df[df["idx"] == date_]
+        s["rows"] = len(df)
+
+    with stats.stage("aggregate") as s:
+        # sleep stages
+        stage_df = df[df["type"] == "HKCategoryTypeIdentifierSleepAnalysis"]
+        type_map = {
+            "HKCategoryValueSleepAnalysisInBed": "In Bed",
+            "HKCategoryValueSleepAnalysisAsleepCore": "Core",
+            "HKCategoryValueSleepAnalysisAsleepREM": "REM",
+            "HKCategoryValueSleepAnalysisAsleepDeep": "Deep",
+            "HKCategoryValueSleepAnalysisAwake": "Awake",
+        }
+
+        stage_df = stage_df[["value", "startDate", "endDate"]]
+        stage_df.rename(
+            columns={"value": "type", "startDate": "start", "endDate": "end"},
+            inplace=True,
+        )
+        stage_df["type"] = stage_df["type"].map(type_map)
+        s["rows"] = len(df)
 
     st.markdown("### ")
     st.subheader("Sleep Stages")
-    st.altair_chart(
-        alt.Chart(stage_df)
-        .mark_bar()
-        .encode(
-            alt.X("start:T").title("Time"),
-            alt.X2("end"),
-            alt.Y("type").title("Type").sort(["In Bed", "Awake", "REM", "Core", "Deep"]),
-            color=alt.Color(
-                "type",
-                scale=alt.Scale(
-                    domain=["In Bed", "Awake", "REM", "Core", "Deep"],
-                    range=["gray", "coral", "#77B0AA", "#135D66", "#003C43"],
+    with stats.stage("chart") as s:
+        st.altair_chart(
+            alt.Chart(stage_df)
+            .mark_bar()
+            .encode(
+                alt.X("start:T").title("Time"),
+                alt.X2("end"),
+                alt.Y("type")
+                .title("Type")
+                .sort(["In Bed", "Awake", "REM", "Core", "Deep"]),
+                color=alt.Color(
+                    "type",
+                    scale=alt.Scale(
+                        domain=["In Bed", "Awake", "REM", "Core", "Deep"],
+                        range=["gray", "coral", "#77B0AA", "#135D66", "#003C43"],
+                    ),
+                    legend=alt.Legend(title="Type"),
                 ),
-                legend=alt.Legend(title="Type"),
-            ),
-            tooltip=[
-                "type",
-                alt.Tooltip("start:T", format="%H:%M"),
-                alt.Tooltip("end:T", format="%H:%M"),
-            ],
+                tooltip=[
+                    "type",
+                    alt.Tooltip("start:T", format="%H:%M"),
+                    alt.Tooltip("end:T", format="%H:%M"),
+                ],
+            )
+            .interactive(),
+            use_container_width=True,
         )
-        .interactive(),
-        use_container_width=True,
-    )
+        s["rows"] = len(stage_df)
 
     st.caption("Different sleep stages are recorded by your Apple Watch :watch:.")
 
@@ -127,13 +149,14 @@ else:
     st.markdown("### ")
     st.subheader("Heart Rate")
 
-    heart_df = df.loc[df["type"] == "HKQuantityTypeIdentifierHeartRate"]
-    heart_df.loc[:, "value"] = heart_df["value"].astype("int64")
+    with stats.stage("aggregate"):
+        heart_df = df.loc[df["type"] == "HKQuantityTypeIdentifierHeartRate"]
+        heart_df.loc[:, "value"] = heart_df["value"].astype("int64")
 
-    inbed_df = stage_df[stage_df["type"] == "In Bed"]
-    stage_df = stage_df[stage_df["type"] != "In Bed"]
-    y_min = heart_df["value"].min() - 5 if len(heart_df["value"]) != 0 else 70
-    y_max = heart_df["value"].max() + 5 if len(heart_df["value"]) != 0 else 90
+        inbed_df = stage_df[stage_df["type"] == "In Bed"]
+        stage_df = stage_df[stage_df["type"] != "In Bed"]
+        y_min = heart_df["value"].min() - 5 if len(heart_df["value"]) != 0 else 70
+        y_max = heart_df["value"].max() + 5 if len(heart_df["value"]) != 0 else 90
 
     inbed = (
         alt.Chart(inbed_df)
@@ -184,9 +207,15 @@ else:
         )
     )
 
-    st.altair_chart(
-        alt.vconcat(inbed, (rect + point).resolve_scale(color="independent")).interactive(),
-        use_container_width=True,
-    )
+    with stats.stage("chart") as s:
+        st.altair_chart(
+            alt.vconcat(
+                inbed, (rect + point).resolve_scale(color="independent")
+            ).interactive(),
+            use_container_width=True,
+        )
+        s["rows"] = len(inbed_df) + len(stage_df) + len(heart_df)
 
     st.caption("Heart rate is also recorded by your Apple Watch :watch:.")
+
+    debug_panel(stats)
@@ -4,42 +4,51 @@ import pandas as pd
 import streamlit as st
 import altair as alt
 import os
+from debug import debug_panel, debug_stats
 
 @st.cache_data
-def get_df():
-    if st.session_state.using_fake:
-        df = st.session_state.df
-    else:
-        path = st.session_state.data_path
-        filename, file_extension = os.path.splitext(path)
-        if file_extension == ".feather":
-            df = pd.read_feather(path)
-        elif file_extension == ".csv":
-            df = pd.read_csv(
-                path, parse_dates=["startDate", "endDate"], date_format="%Y-%m-%d %H:%M:%S"
-            )
+def get_df(_stats):
+    # _stats is not hashed, and its stages are only recorded on a cache miss
+    with _stats.stage("load") as s:
+        if st.session_state.using_fake:
+            df = st.session_state.df
         else:
-            raise IOError(
-                "Unsupported file types. Currently supports .csv or .feather file."
-            )
-
-    df.drop_duplicates(inplace=True)
-
-    df = df.loc[df["value"] == "HKCategoryValueSleepAnalysisInBed"]
-    date_col = ["startDate", "endDate"]
-
-    df[date_col] = df[date_col].apply(
-        lambda x: pd.to_datetime(x.dt.strftime(date_format='%Y-%m-%d %H:%M:%S'), 
-        format='%Y-%m-%d %H:%M:%S'),
-        axis=1,
-    )
+            path = st.session_state.data_path
+            filename, file_extension = os.path.splitext(path)
+            if file_extension == ".feather":
+                df = pd.read_feather(path)
+            elif file_extension == ".csv":
+                df = pd.read_csv(
+                    path,
+                    parse_dates=["startDate", "endDate"],
+                    date_format="%Y-%m-%d %H:%M:%S",
+                )
+            else:
+                raise IOError(
+                    "Unsupported file types. Currently supports .csv or .feather file."
+                )
+        s["rows"] = len(df)
+
+    with _stats.stage("clean") as s:
+        df.drop_duplicates(inplace=True)
+
+        df = df.loc[df["value"] == "HKCategoryValueSleepAnalysisInBed"]
+        date_col = ["startDate", "endDate"]
+
+        df[date_col] = df[date_col].apply(
+            lambda x: pd.to_datetime(x.dt.strftime(date_format='%Y-%m-%d %H:%M:%S'), 
+            format='%Y-%m-%d %H:%M:%S'),
+            axis=1,
+        )
 
-    df["duration"] = df["endDate"] - df["startDate"]
-    df = df.loc[df["duration"] >= timedelta(minutes=5)]  # remove durations <= 5 minutes
-    # D0 sleep: D0 18:00 - D1 18:00
-    df["idx"] = df["startDate"].apply(
-        lambda x: x.date() if x.hour >= 18 else x.date() - timedelta(days=1)
-    )
+        df["duration"] = df["endDate"] - df["startDate"]
+        # remove durations <= 5 minutes
+        df = df.loc[df["duration"] >= timedelta(minutes=5)]
+        # D0 sleep: D0 18:00 - D1 18:00
+        df["idx"] = df["startDate"].apply(
+            lambda x: x.date() if x.hour >= 18 else x.date() - timedelta(days=1)
+        )
+        s["rows"] = len(df)
 
     return df
 
@@ -56,6 +65,8 @@ st.set_page_config(
 st.markdown("# Overall Sleep")
 st.write("""Choose start date and end date to analyze your daily sleep time.""")
 
+stats = debug_stats()
+
 if "data_path" not in st.session_state:
     st.session_state.data_path = None
 if "df" not in st.session_state:
@@ -69,7 +80,8 @@ if st.session_state.data_path is None and st.session_state.df is None:
         st.switch_page("home.py")
 else:
     # get data and limited its range
-    df = get_df()
+    df = get_df(stats)
+    stats.meta["cache_hit"] = "load" not in stats
 
     start_date = st.date_input(
         "Start date",
@@ -83,10 +95,14 @@ else:
         min_value=df["idx"].min(),
         max_value=df["idx"].max(),
     )
-    df = df.loc[df["idx"].between(start_date, end_date)]
+    with stats.stage("filter") as s:
+        df = df.loc[df["idx"].between(start_date, end_date)]
+        s["rows"] = len(df)
 
-    area_df = df.groupby("idx").duration.sum().reset_index()
-    area_df["duration"] = area_df["duration"].dt.total_seconds()
+    with stats.stage("aggregate") as s:
+        area_df = df.groupby("idx").duration.sum().reset_index()
+        area_df["duration"] = area_df["duration"].dt.total_seconds()
+        s["rows"] = len(df)
 
     area_base = alt.Chart(area_df)
 
@@ -103,13 +119,16 @@ else:
 
     st.markdown("###")
     st.subheader("In Bed Time")
-    st.altair_chart(area_line, use_container_width=True)
+    with stats.stage("chart") as s:
+        st.altair_chart(area_line, use_container_width=True)
+        s["rows"] = len(area_df)
 
     # Add metrics
     col1, col2, col3 = st.columns(3)
-    q1 = np.quantile(area_df["duration"], 0.25)
-    q2 = np.quantile(area_df["duration"], 0.5)
-    q3 = np.quantile(area_df["duration"], 0.75)
+    with stats.stage("aggregate"):
+        q1 = np.quantile(area_df["duration"], 0.25)
+        q2 = np.quantile(area_df["duration"], 0.5)
+        q3 = np.quantile(area_df["duration"], 0.75)
 
     col1.metric(label="Median", value=timedelta_to_hourminute(q2), help="50% percentile")
     col2.metric(label="Q1", value=timedelta_to_hourminute(q1), help="25% percentile")
@@ -118,22 +137,28 @@ else:
     st.markdown("###")
     st.subheader("Bed Time and Wake Up Time")
 
-    line_df = (
-        df.groupby("idx").agg(
-            bed_time=("startDate", "min"),
-            wakeup_time=("endDate", "max"),
+    with stats.stage("aggregate"):
+        line_df = (
+            df.groupby("idx").agg(
+                bed_time=("startDate", "min"),
+                wakeup_time=("endDate", "max"),
+            )
+        ).reset_index()
+
+        line_df["idx"] = line_df["idx"].apply(
+            lambda x: datetime.combine(x, time(hour=18))
+        )
+        line_df["bed_time"] -= line_df["idx"]
+        line_df["wakeup_time"] -= line_df["idx"]
+        # add date to simplify formatting
+        line_df["bed_time"] = datetime(2024, 1, 1, 18, 0, 0) + line_df["bed_time"]
+        line_df["wakeup_time"] = (
+            datetime(2024, 1, 1, 18, 0, 0) + line_df["wakeup_time"]
+        )
+        line_df.rename(
+            columns={"bed_time": "Bed Time", "wakeup_time": "Wake Up Time"},
+            inplace=True,
         )
-    ).reset_index()
-
-    line_df["idx"] = line_df["idx"].apply(lambda x: datetime.combine(x, time(hour=18)))
-    line_df["bed_time"] -= line_df["idx"]
-    line_df["wakeup_time"] -= line_df["idx"]
-    # add date to simplify formatting
-    line_df["bed_time"] = datetime(2024, 1, 1, 18, 0, 0) + line_df["bed_time"]
-    line_df["wakeup_time"] = datetime(2024, 1, 1, 18, 0, 0) + line_df["wakeup_time"]
-    line_df.rename(
-        columns={"bed_time": "Bed Time", "wakeup_time": "Wake Up Time"}, inplace=True
-    )
 
 
     hist_base = (
@@ -162,7 +187,11 @@ else:
         ],
     )
 
-    st.altair_chart((hist_line + hist_rule).interactive(), use_container_width=True)
+    with stats.stage("chart") as s:
+        st.altair_chart(
+            (hist_line + hist_rule).interactive(), use_container_width=True
+        )
+        s["rows"] = len(line_df)
 
     # Add metrics
     col1, col2 = st.columns(2)
@@ -177,3 +206,5 @@ else:
         value=wake_q2.strftime("%H:%M"),
         help="50% percentile",
     )
+
+    debug_panel(stats)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from apple_health_exporter import parse_ecg, parse_route
+
+ECG_CSV = """\
+Name,Jane Appleseed
+Date of Birth,"Jan 1, 1990"
+Recorded Date,2023-05-01 08:30:00 +0200
+Classification,Sinus Rhythm
+Symptoms,
+Software Version,2
+Device,"Watch6,2"
+Sample Rate,512 hertz
+
+Lead,Lead I
+Unit,µV
+
+-12.5
+30.25
+101.0
+"""
+
+GPX = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="Apple Health Export"
+ xmlns="http://www.topografix.com/GPX/1/1">
+ <metadata><time>2023-05-01T06:00:00Z</time></metadata>
+ <trk>
+  <name>Route 2023-05-01 8:00am</name>
+  <trkseg>
+   <trkpt lon="121.5654" lat="25.0330"><ele>9.5</ele>
+    <time>2023-05-01T06:00:00Z</time>
+    <extensions><speed>2.5</speed><course>90.0</course>
+     <hAcc>3.0</hAcc><vAcc>2.0</vAcc></extensions></trkpt>
+   <trkpt lon="121.5655" lat="25.0331"><ele>9.8</ele>
+    <time>2023-05-01T06:00:01Z</time>
+    <extensions><speed>2.6</speed><course>91.0</course>
+     <hAcc>3.0</hAcc><vAcc>2.0</vAcc></extensions></trkpt>
+  </trkseg>
+ </trk>
+</gpx>
+"""
+
+
+def test_parse_ecg(tmp_path):
+    path = tmp_path / "ecg_2023-05-01.csv"
+    path.write_text(ECG_CSV, encoding="utf-8")
+
+    columns = parse_ecg(path)
+
+    assert columns["voltage"].dtype == np.float32
+    np.testing.assert_allclose(columns["voltage"], [-12.5, 30.25, 101.0])
+    start = pd.Timestamp("2023-05-01 06:30:00").to_datetime64()
+    step = np.timedelta64(1_000_000_000 // 512, "ns")
+    np.testing.assert_array_equal(columns["time"], start + np.arange(3) * step)
+
+
+def test_parse_ecg_localized_header(tmp_path):
+    # Localized keys fall back to the line position
+    path = tmp_path / "ecg.csv"
+    localized = ECG_CSV.replace("Recorded Date", "Aufnahmedatum").replace(
+        "Sample Rate", "Abtastrate"
+    )
+    path.write_text(localized, encoding="utf-8")
+
+    assert len(parse_ecg(path)["voltage"]) == 3
+
+
+def test_parse_ecg_unrecognized_header(tmp_path):
+    # A different line order must not be silently misread
+    path = tmp_path / "ecg.csv"
+    reordered = ECG_CSV.replace("Recorded Date", "Aufnahmedatum").replace(
+        "Classification,Sinus Rhythm\n", ""
+    )
+    reordered = reordered.replace("Name,", "Classification,Sinus Rhythm\nName,")
+    path.write_text(reordered, encoding="utf-8")
+
+    with pytest.raises(ValueError, match="not found in ECG header"):
+        parse_ecg(path)
+
+
+def test_parse_route(tmp_path):
+    path = tmp_path / "route_2023-05-01_8.00am.gpx"
+    path.write_text(GPX, encoding="utf-8")
+
+    columns = parse_route(path)
+
+    for name in ["lat", "lon", "elevation", "speed"]:
+        assert columns[name].dtype == np.float32
+    np.testing.assert_allclose(columns["lat"], [25.0330, 25.0331], rtol=1e-6)
+    np.testing.assert_allclose(columns["speed"], [2.5, 2.6], rtol=1e-6)
+    np.testing.assert_array_equal(
+        columns["time"],
+        np.array(
+            ["2023-05-01T06:00:00", "2023-05-01T06:00:01"], dtype="datetime64[ns]"
+        ),
+    )